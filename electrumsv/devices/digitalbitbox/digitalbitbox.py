@@ -516,7 +516,7 @@ class DigitalBitbox_KeyStore(Hardware_KeyStore):
             pubkeyarray = []
 
             # Build hasharray from inputs
-            for txin in tx.inputs:
+            for input_index, txin in enumerate(tx.inputs):
                 if txin.type() != ScriptType.P2PKH:
                     p2pkhTransaction = False
 
@@ -526,7 +526,7 @@ class DigitalBitbox_KeyStore(Hardware_KeyStore):
                         assert len(key_derivation) == 2
                         inputPath = self.get_derivation() +"/"+ \
                             "/".join(str(pv) for pv in key_derivation)
-                        inputHash = tx.preimage_hash(txin)
+                        inputHash = tx.preimage_hash(input_index, txin)
                         hasharray_i = {'hash': inputHash.hex(), 'keypath': inputPath}
                         hasharray.append(hasharray_i)
                         inputhasharray.append(inputHash)
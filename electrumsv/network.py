@@ -51,6 +51,7 @@ from .constants import API_SERVER_TYPES, NetworkServerType, TransactionImportFla
 from .i18n import _
 from .logs import logs
 from .network_support.api_server import NewServer, NewServerAPIContext
+from .network_support.mapi import close_mapi_client
 from .networks import Net
 from .subscription import SubscriptionManager
 from .transaction import Transaction
@@ -1582,6 +1583,7 @@ class Network(TriggeredCallbacks):
         self.future.cancel()
         await self.shutdown_complete_event.wait()
         assert not self.sessions
+        await close_mapi_client()
         self.subscriptions.stop()
         logger.warning('stopped')
 
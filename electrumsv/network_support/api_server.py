@@ -1,7 +1,10 @@
+from collections import defaultdict
 import dataclasses
 import datetime
+from functools import lru_cache
 import json
-from typing import Any, cast, Dict, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+from typing import (Any, cast, DefaultDict, Dict, FrozenSet, List, NamedTuple, Optional, Tuple,
+    TYPE_CHECKING)
 
 import dateutil.parser
 
@@ -23,6 +26,11 @@ __all__ = [ "NewServerAPIContext", "NewServerAccessState", "NewServer" ]
 
 STALE_PERIOD_SECONDS = 60 * 60 * 24
 
+DEFAULT_AUTHORIZATION_TEMPLATE = "Authorization: Bearer {API_KEY}"
+
+# Distinguishes a missing client entry from one that is present with a `None` credential id.
+_NO_CREDENTIAL_ENTRY = object()
+
 
 @dataclasses.dataclass
 class CapabilitySupport:
@@ -50,6 +58,20 @@ SERVER_CAPABILITIES = {
     ]
 }
 
+# The usable capabilities of each server type, for cheap membership checks when selecting
+# servers. Capabilities that are not yet supported are excluded so that they cannot be selected.
+_SERVER_CAPABILITY_PAIRS: FrozenSet[Tuple[NetworkServerType, ServerCapability]] = frozenset(
+    (server_type, capability.type)
+    for server_type, capabilities in SERVER_CAPABILITIES.items()
+    for capability in capabilities if not capability.is_unsupported
+)
+
+
+@lru_cache(maxsize=256)
+def _parse_iso_timestamp(timestamp_text: str) -> datetime.datetime:
+    # The same fee quote timestamps are checked repeatedly until the fee quote is replaced.
+    return dateutil.parser.isoparse(timestamp_text)
+
 
 class NewServerAPIContext(NamedTuple):
     wallet_path: str
@@ -66,8 +88,14 @@ class NewServerAccessState:
         ## MAPI state.
         # JSON envelope for the actual serialised fee quote JSON.
         self.last_fee_quote_response: Optional[JSONEnvelope] = None
+        # The serialised JSON envelope if known, so that persisting it does not reserialise it.
+        self._last_fee_quote_response_json: Optional[str] = None
         # The fee quote we locally extracted and deserialised from the fee quote response.
         self.last_fee_quote: Optional[FeeQuote] = None
+        # The estimator for the fee quote it was created from, so that the fee schedule is only
+        # processed once for each fee quote rather than every time we prioritise servers.
+        self._fee_estimator: Optional[MAPIFeeEstimator] = None
+        self._fee_estimator_quote: Optional[FeeQuote] = None
 
     def record_attempt(self) -> None:
         self.last_try = datetime.datetime.now(datetime.timezone.utc).timestamp()
@@ -75,6 +103,26 @@ class NewServerAccessState:
     def record_success(self) -> None:
         self.last_good = datetime.datetime.now(datetime.timezone.utc).timestamp()
 
+    def get_fee_estimator(self) -> MAPIFeeEstimator:
+        """
+        Get the fee estimator for the current fee quote.
+
+        Raises `AssertionError` if there is no current fee quote.
+        """
+        assert self.last_fee_quote is not None
+        if self._fee_estimator is None or self._fee_estimator_quote is not self.last_fee_quote:
+            self._fee_estimator = MAPIFeeEstimator(self.last_fee_quote)
+            self._fee_estimator_quote = self.last_fee_quote
+        return self._fee_estimator
+
+    def get_fee_quote_response_json(self) -> Optional[str]:
+        """
+        Get the serialised JSON envelope for the current fee quote response, if there is one.
+        """
+        if self.last_fee_quote_response and self._last_fee_quote_response_json is None:
+            self._last_fee_quote_response_json = json.dumps(self.last_fee_quote_response)
+        return self._last_fee_quote_response_json
+
     def update_fee_quote(self, fee_response: JSONEnvelope) -> None:
         """
         Put in place a new fee quote received from just completed server usage.
@@ -82,9 +130,12 @@ class NewServerAccessState:
         timestamp = datetime.datetime.now(datetime.timezone.utc).timestamp()
         self.set_fee_quote(fee_response, timestamp)
 
-    def set_fee_quote(self, fee_response: Optional[JSONEnvelope], timestamp: float) -> None:
+    def set_fee_quote(self, fee_response: Optional[JSONEnvelope], timestamp: float,
+            fee_response_json: Optional[str]=None) -> None:
         """
         Set the values for any existing (restored from DB) or new fee quote.
+
+        fee_response_json: The serialised form of `fee_response` if the caller has it.
         """
         # Remember that we store server state in wallet databases when the server is associated
         # either with that wallet, or with accounts within it, and we may get stale state or
@@ -93,6 +144,7 @@ class NewServerAccessState:
             return
         self.last_good = timestamp
         self.last_fee_quote_response = fee_response
+        self._last_fee_quote_response_json = fee_response_json if fee_response else None
         self.last_fee_quote = None
         if fee_response:
             self.last_fee_quote = cast(FeeQuote, json.loads(fee_response['payload']))
@@ -109,12 +161,23 @@ class NewServer:
 
         # These are the enabled clients, whether they use an API key and the id if so.
         self.client_api_keys: Dict[NewServerAPIContext, Optional[IndefiniteCredentialId]] = {}
+        # The enabled clients for each wallet, so that unloading a wallet does not have to scan
+        # the clients for every other loaded wallet. These are dictionaries rather than sets so
+        # that they are unregistered in the order they were registered.
+        self._client_keys_by_wallet: DefaultDict[str, Dict[NewServerAPIContext, None]] = \
+            defaultdict(dict)
         # We keep per-API key state for a reason. An API key can be considered to be a distinct
         # account with the service, and it makes sense to keep the statistics/metadata for the
         # service separated by API key for this reason. We intentionally leave these in place
         # at least for now as they are kind of relative to the given key value.
         self.api_key_state: Dict[Optional[IndefiniteCredentialId], NewServerAccessState] = {}
 
+        # The authorization header template is split when the config changes, not per request.
+        self._authorization_header_key = ""
+        self._authorization_header_value = ""
+        self._set_authorization_template(
+            config.get("api_key_template") if config is not None else None)
+
         # We need to put any config credential in the credential cache. The only time that there
         # will not be an application config entry, is where the server is from an external wallet.
         if config is not None:
@@ -122,8 +185,7 @@ class NewServer:
                 decrypted_api_key = pw_decode(config["api_key"], TOKEN_PASSWORD)
                 self.config_credential_id = \
                     app_state.credentials.add_indefinite_credential(decrypted_api_key)
-            if self.config_credential_id not in self.api_key_state:
-                self.api_key_state[self.config_credential_id] = NewServerAccessState()
+            self.api_key_state.setdefault(self.config_credential_id, NewServerAccessState())
 
     def set_wallet_usage(self, wallet_path: str, server_state: NetworkServerState) -> None:
         """
@@ -135,10 +197,10 @@ class NewServer:
         """
         usage_context = NewServerAPIContext(wallet_path, server_state.key.account_id)
         self.client_api_keys[usage_context] = server_state.credential_id
+        self._client_keys_by_wallet[wallet_path][usage_context] = None
 
-        if server_state.credential_id not in self.api_key_state:
-            self.api_key_state[server_state.credential_id] = NewServerAccessState()
-        key_state = self.api_key_state[server_state.credential_id]
+        key_state = self.api_key_state.setdefault(server_state.credential_id,
+            NewServerAccessState())
         if server_state.date_last_good > key_state.last_good:
             key_state.last_try = max(key_state.last_try, server_state.date_last_try)
             # Fee quote state is only relevant for MAPI.
@@ -146,11 +208,17 @@ class NewServer:
                 fee_response: Optional[JSONEnvelope] = None
                 if server_state.mapi_fee_quote_json:
                     fee_response = cast(JSONEnvelope, json.loads(server_state.mapi_fee_quote_json))
-                key_state.set_fee_quote(fee_response, server_state.date_last_good)
+                key_state.set_fee_quote(fee_response, server_state.date_last_good,
+                    server_state.mapi_fee_quote_json)
 
     def remove_wallet_usage(self, wallet_path: str, specific_server_key: ServerAccountKey) -> None:
         usage_context = NewServerAPIContext(wallet_path, specific_server_key.account_id)
         del self.client_api_keys[usage_context]
+        wallet_client_keys = self._client_keys_by_wallet.get(wallet_path)
+        if wallet_client_keys is not None:
+            wallet_client_keys.pop(usage_context, None)
+            if not wallet_client_keys:
+                del self._client_keys_by_wallet[wallet_path]
 
     def unregister_wallet(self, wallet_path: str) -> List[NetworkServerState]:
         """
@@ -161,18 +229,15 @@ class NewServer:
         """
         # This wallet is being unloaded so remove all it's involvement with the server.
         results: List[NetworkServerState] = []
-        for client_key, credential_id in list(self.client_api_keys.items()):
-            if client_key.wallet_path != wallet_path:
-                continue
-            del self.client_api_keys[client_key]
+        for client_key in self._client_keys_by_wallet.pop(wallet_path, {}):
+            credential_id = self.client_api_keys.pop(client_key)
 
             key_state = self.api_key_state[credential_id]
             specific_server_key = ServerAccountKey(self.url, self.server_type,
                 client_key.account_id)
             mapi_fee_quote_json: Optional[str] = None
             if self.server_type == NetworkServerType.MERCHANT_API:
-                if key_state.last_fee_quote_response:
-                    mapi_fee_quote_json = json.dumps(key_state.last_fee_quote_response)
+                mapi_fee_quote_json = key_state.get_fee_quote_response_json()
             else:
                 assert key_state.last_fee_quote_response is None
             server_state = NetworkServerState(specific_server_key, credential_id,
@@ -193,13 +258,15 @@ class NewServer:
             app_state.credentials.remove_indefinite_credential(self.config_credential_id)
             self.config_credential_id = None
 
+        if "api_key_template" in config_update:
+            self._set_authorization_template(config_update["api_key_template"])
+
         new_encrypted_api_key = config_update.get("api_key")
         if new_encrypted_api_key:
             decrypted_api_key = pw_decode(new_encrypted_api_key, TOKEN_PASSWORD)
             self.config_credential_id = \
                 app_state.credentials.add_indefinite_credential(decrypted_api_key)
-            if self.config_credential_id not in self.api_key_state:
-                self.api_key_state[self.config_credential_id] = NewServerAccessState()
+            self.api_key_state.setdefault(self.config_credential_id, NewServerAccessState())
 
     def is_unusable(self) -> bool:
         """
@@ -236,10 +303,10 @@ class NewServer:
         # the expiry date being a usable value. So for now we ignore it and assume that it
         # will be enough to just refresh the fee quote around once a day in a haphazard way.
         if False:
-            expiry_date = dateutil.parser.isoparse(key_state.last_fee_quote["expiryTime"])
+            expiry_date = _parse_iso_timestamp(key_state.last_fee_quote["expiryTime"])
             return now_date > expiry_date
 
-        retrieved_date = dateutil.parser.isoparse(key_state.last_fee_quote["timestamp"])
+        retrieved_date = _parse_iso_timestamp(key_state.last_fee_quote["timestamp"])
         return (now_date - retrieved_date).total_seconds() > STALE_PERIOD_SECONDS
 
     def get_credential_id(self, client_key: NewServerAPIContext) \
@@ -251,13 +318,15 @@ class NewServer:
         use the given server, and the credential id which can be `None` for no credential.
         """
         # Look up the account.
-        if client_key in self.client_api_keys:
-            return True, self.client_api_keys[client_key]
+        credential_id = self.client_api_keys.get(client_key, _NO_CREDENTIAL_ENTRY)
+        if credential_id is not _NO_CREDENTIAL_ENTRY:
+            return True, cast(Optional[IndefiniteCredentialId], credential_id)
 
         # Look up the account's wallet as the first fallback.
         wallet_client_key = NewServerAPIContext(client_key.wallet_path, -1)
-        if wallet_client_key in self.client_api_keys:
-            return True, self.client_api_keys[wallet_client_key]
+        credential_id = self.client_api_keys.get(wallet_client_key, _NO_CREDENTIAL_ENTRY)
+        if credential_id is not _NO_CREDENTIAL_ENTRY:
+            return True, cast(Optional[IndefiniteCredentialId], credential_id)
 
         # Finally we look up the application server for this URL, if there is one, and if it
         # is enabled for global use, we use it's api key.
@@ -272,15 +341,17 @@ class NewServer:
         if credential_id is None:
             return {}
 
-        authorization_header = "Authorization: Bearer {API_KEY}"
-        if self.config is not None:
-            authorization_header_override = self.config.get("api_key_template")
-            if authorization_header_override:
-                authorization_header = cast(str, authorization_header_override)
-
         decrypted_api_key = app_state.credentials.get_indefinite_credential(credential_id)
+        return { self._authorization_header_key:
+            self._authorization_header_value.format(API_KEY=decrypted_api_key) }
+
+    def _set_authorization_template(self, template_override: Optional[str]) -> None:
+        authorization_header = DEFAULT_AUTHORIZATION_TEMPLATE
+        if template_override:
+            authorization_header = template_override
         header_key, _separator, header_value = authorization_header.partition(": ")
-        return { header_key: header_value.format(API_KEY=decrypted_api_key) }
+        self._authorization_header_key = header_key
+        self._authorization_header_value = header_value
 
 
 class SelectionCandidate(NamedTuple):
@@ -301,13 +372,8 @@ def select_servers(capability_type: ServerCapability, candidates: List[Selection
 
     Returns the subset of `candidates` that support the given capability type.
     """
-    filtered_servers: List[SelectionCandidate] = []
-    for candidate in candidates:
-        for server_capability in SERVER_CAPABILITIES[candidate.server_type]:
-            if server_capability.type == capability_type:
-                filtered_servers.append(candidate)
-                break
-    return filtered_servers
+    return [ candidate for candidate in candidates
+        if (candidate.server_type, capability_type) in _SERVER_CAPABILITY_PAIRS ]
 
 
 class BroadcastCandidate(NamedTuple):
@@ -338,9 +404,7 @@ def prioritise_broadcast_servers(estimated_tx_size: TransactionSize,
         if candidate.server_type == NetworkServerType.MERCHANT_API:
             assert candidate.api_server is not None
             key_state = candidate.api_server.api_key_state[candidate.credential_id]
-            assert key_state.last_fee_quote is not None
-            estimator = MAPIFeeEstimator(key_state.last_fee_quote)
-            fee_estimator = estimator.estimate_fee
+            fee_estimator = key_state.get_fee_estimator().estimate_fee
         elif candidate.server_type == NetworkServerType.ELECTRUMX:
             # NOTE At some point if ElectrumX servers stick around maybe they will do their
             #   own fee quotes.
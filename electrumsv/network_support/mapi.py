@@ -88,24 +88,26 @@ async def decode_response_body(response: aiohttp.ClientResponse) -> Dict[Any, An
     return cast(Dict[Any, Any], json.loads(body.decode()))
 
 
-# self.mapi_client: Optional[aiohttp.ClientSession] = None
-#
-# async def _get_mapi_client(self):
-#     # aiohttp session needs to be initialised in async function
-#     # https://github.com/tiangolo/fastapi/issues/301
-#     if self.mapi_client is None:
-#         # resolver = AsyncResolver()
-#         # conn = aiohttp.TCPConnector(family=socket.AF_INET, resolver=resolver,
-#         #      ttl_dns_cache=10,
-#         #                             force_close=True, enable_cleanup_closed=True)
-#         # self.mapi_client = aiohttp.ClientSession(connector=conn)
-#         self.mapi_client = aiohttp.ClientSession()
-#     return self.mapi_client
-#
-# async def _close_mapi_client(self) -> None:
-#     logger.debug("closing aiohttp client session.")
-#     if self.mapi_client:
-#         await self.mapi_client.close()
+# A single client session is shared by all MAPI requests so that connections to each server are
+# pooled and kept alive, rather than paying for a new TCP and TLS handshake for every request.
+_mapi_client: Optional[aiohttp.ClientSession] = None
+
+
+def _get_mapi_client() -> aiohttp.ClientSession:
+    # The aiohttp session needs to be created within the event loop that will be using it.
+    # https://github.com/tiangolo/fastapi/issues/301
+    global _mapi_client
+    if _mapi_client is None or _mapi_client.closed:
+        _mapi_client = aiohttp.ClientSession()
+    return _mapi_client
+
+
+async def close_mapi_client() -> None:
+    global _mapi_client
+    if _mapi_client is not None:
+        logger.debug("closing aiohttp client session.")
+        await _mapi_client.close()
+        _mapi_client = None
 
 
 def poll_servers(network: "Network", account: "AbstractAccount") \
@@ -146,24 +148,24 @@ async def get_fee_quote(server: "NewServer",
     headers.update(server.get_authorization_headers(credential_id))
     is_ssl = url.startswith("https")
 
-    async with aiohttp.ClientSession() as client:
-        async with client.get(url, headers=headers, ssl=is_ssl) as resp:
-            try:
-                json_response = await decode_response_body(resp)
-            except (ClientConnectorError, ConnectionError, OSError, SOCKSError):
-                logger.error("failed connecting to %s", url)
+    client = _get_mapi_client()
+    async with client.get(url, headers=headers, ssl=is_ssl) as resp:
+        try:
+            json_response = await decode_response_body(resp)
+        except (ClientConnectorError, ConnectionError, OSError, SOCKSError):
+            logger.error("failed connecting to %s", url)
+        else:
+            if resp.status != 200:
+                logger.error("feeQuote request to %s failed with: status: %s, reason: %s",
+                    url, resp.status, resp.reason)
             else:
-                if resp.status != 200:
-                    logger.error("feeQuote request to %s failed with: status: %s, reason: %s",
-                        url, resp.status, resp.reason)
-                else:
-                    assert json_response['encoding'].lower() == 'utf-8'
+                assert json_response['encoding'].lower() == 'utf-8'
 
-                    fee_quote_response = cast(JSONEnvelope, json_response)
-                    validate_json_envelope(fee_quote_response)
-                    logger.debug("fee quote received from %s", server.url)
+                fee_quote_response = cast(JSONEnvelope, json_response)
+                validate_json_envelope(fee_quote_response)
+                logger.debug("fee quote received from %s", server.url)
 
-                    server_state.update_fee_quote(fee_quote_response)
+                server_state.update_fee_quote(fee_quote_response)
 
 
 def validate_json_envelope(json_response: JSONEnvelope) -> None:
@@ -200,27 +202,27 @@ async def broadcast_transaction(tx: "Transaction", server: "NewServer",
     headers.update(server.get_authorization_headers(credential_id))
     is_ssl = url.startswith("https")
 
-    async with aiohttp.ClientSession() as client:
-        async with client.post(url, ssl=is_ssl, headers=headers, params=params,
-                data=tx.to_bytes()) as response:
-            try:
-                json_response = await decode_response_body(response)
-            except (ClientConnectorError, ConnectionError, OSError, SOCKSError):
-                logger.error("failed connecting to %s", url)
+    client = _get_mapi_client()
+    async with client.post(url, ssl=is_ssl, headers=headers, params=params,
+            data=tx.to_bytes()) as response:
+        try:
+            json_response = await decode_response_body(response)
+        except (ClientConnectorError, ConnectionError, OSError, SOCKSError):
+            logger.error("failed connecting to %s", url)
+        else:
+            if response.status != 200:
+                logger.error("feeQuote request to %s failed with: status: %s, reason: %s",
+                    url, response.status, response.reason)
             else:
-                if response.status != 200:
-                    logger.error("feeQuote request to %s failed with: status: %s, reason: %s",
-                        url, response.status, response.reason)
-                else:
-                    assert json_response['encoding'].lower() == 'utf-8'
-
-                    broadcast_response = cast(JSONEnvelope, json_response)
-                    validate_json_envelope(broadcast_response)
-                    logger.debug("transaction broadcast via MAPI server: %s", server.url)
-
-                    # TODO(MAPI) Work out if we should be processing the response.
-                    # TODO(MAPI) Work out if we should be storing the response.
-                    server_state.record_success()
+                assert json_response['encoding'].lower() == 'utf-8'
+
+                broadcast_response = cast(JSONEnvelope, json_response)
+                validate_json_envelope(broadcast_response)
+                logger.debug("transaction broadcast via MAPI server: %s", server.url)
+
+                # TODO(MAPI) Work out if we should be processing the response.
+                # TODO(MAPI) Work out if we should be storing the response.
+                server_state.record_success()
 
 
 class MAPIFeeEstimator:
@@ -2,9 +2,10 @@ import pytest
 
 from electrumsv.constants import ScriptType
 from electrumsv.script import AccumulatorMultiSigOutput
-from electrumsv.transaction import create_script_sig, NO_SIGNATURE
+from electrumsv.transaction import bare_multisignatures, create_script_sig, dummy_signature, \
+    estimated_script_sig_size, NO_SIGNATURE
 
-from bitcoinx import PrivateKey
+from bitcoinx import PrivateKey, PublicKey
 
 
 private_keys_hex = [
@@ -107,3 +108,32 @@ def test_accumulator_multisig_scriptpubkey_ofM(m, script_hex):
     output = AccumulatorMultiSigOutput(public_keys, m)
     assert output.to_script_bytes().hex() == script_hex
 
+
+@pytest.mark.parametrize("script_type,threshold,key_count", [
+    (ScriptType.P2PK, 1, 1),
+    (ScriptType.P2PKH, 1, 1),
+    (ScriptType.MULTISIG_BARE, 2, 3),
+    (ScriptType.MULTISIG_P2SH, 1, 1),
+    (ScriptType.MULTISIG_P2SH, 2, 3),
+    (ScriptType.MULTISIG_ACCUMULATOR, 2, 3),
+])
+@pytest.mark.parametrize("compressed", [ True, False ])
+def test_estimated_script_sig_size(script_type, threshold, key_count, compressed):
+    public_keys = [ PrivateKey.from_hex(private_keys_hex[i]).public_key
+        for i in range(key_count) ]
+    public_key_bytes = [ public_key.to_bytes(compressed=compressed)
+        for public_key in public_keys ]
+    signatures = [ dummy_signature ] * threshold
+    script = create_script_sig(script_type, threshold,
+        [ PublicKey.from_bytes(value) for value in public_key_bytes ], signatures)
+    assert estimated_script_sig_size(script_type, threshold,
+        [ len(value) for value in public_key_bytes ]) == len(script.to_bytes())
+
+
+@pytest.mark.parametrize("threshold,signatures,expected_signatures", [
+    (0, [ b"a", NO_SIGNATURE ], []),
+    (2, [ NO_SIGNATURE, b"a", NO_SIGNATURE, b"b", b"c" ], [ b"a", b"b" ]),
+    (3, [ NO_SIGNATURE, b"a", NO_SIGNATURE ], [ b"a", NO_SIGNATURE, NO_SIGNATURE ]),
+])
+def test_bare_multisignatures(threshold, signatures, expected_signatures):
+    assert bare_multisignatures(threshold, signatures) == expected_signatures
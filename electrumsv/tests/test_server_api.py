@@ -1,3 +1,5 @@
+import datetime
+import json
 from typing import cast
 import unittest.mock
 import uuid
@@ -6,7 +8,8 @@ import pytest
 
 from electrumsv.constants import NetworkServerType, ServerCapability
 from electrumsv.network_support import api_server, mapi
-from electrumsv.types import IndefiniteCredentialId, TransactionSize
+from electrumsv.types import IndefiniteCredentialId, NetworkServerState, ServerAccountKey, \
+    TransactionSize
 
 
 def test_get_authorization_headers_credential_none() -> None:
@@ -26,6 +29,15 @@ server_params = [
     # Override the api key template with a custom one.
     ({ "api_key_template": "Authorization: Bearer testnet_{API_KEY}" },
         { "Authorization": "Bearer testnet_kredential" }),
+    # Override the api key template with one that has text after the api key.
+    ({ "api_key_template": "X-Api-Key: {{{API_KEY}}}" }, { "X-Api-Key": "{kredential}" }),
+    # Escaped braces are not a placeholder.
+    ({ "api_key_template": "X-Api-Key: {{API_KEY}}" }, { "X-Api-Key": "{API_KEY}" }),
+    # The placeholder can be used more than once.
+    ({ "api_key_template": "X-Api-Key: {API_KEY}-{API_KEY}" },
+        { "X-Api-Key": "kredential-kredential" }),
+    # The placeholder can have a format specification.
+    ({ "api_key_template": "X-Api-Key: {API_KEY:>12}" }, { "X-Api-Key": "  kredential" }),
 ]
 
 
@@ -42,6 +54,27 @@ def test_get_authorization_headers_credential_default_header(app_state, params)
     assert headers == expected_headers
 
 
+@unittest.mock.patch('electrumsv.network_support.api_server.app_state')
+def test_get_authorization_headers_template_config_change(app_state) -> None:
+    app_state.credentials = unittest.mock.Mock()
+    app_state.credentials.get_indefinite_credential.side_effect = lambda v: "kredential"
+
+    credential_id = cast(IndefiniteCredentialId, uuid.uuid4())
+    server = api_server.NewServer("my_url", NetworkServerType.MERCHANT_API, {})
+    config_update = { "api_key_template": "Authorization: Bearer testnet_{API_KEY}" }
+    server.on_pending_config_change(config_update)
+    assert server.get_authorization_headers(credential_id) == \
+        { "Authorization": "Bearer testnet_kredential" }
+
+    # An update that does not touch the template leaves the existing template in place.
+    server.on_pending_config_change({ "enabled_for_all_wallets": False })
+    assert server.get_authorization_headers(credential_id) == \
+        { "Authorization": "Bearer testnet_kredential" }
+
+    server.on_pending_config_change({ "api_key_template": "" })
+    assert server.get_authorization_headers(credential_id) == default_server_header
+
+
 def test_select_servers_empty_input() -> None:
     assert [] == api_server.select_servers(ServerCapability.TRANSACTION_BROADCAST, [])
 
@@ -76,6 +109,25 @@ def test_select_servers_filter_reduced_outputs() -> None:
     assert [ servers[0] ] == selected_candidates
 
 
+def test_select_servers_filter_unsupported_capability() -> None:
+    servers = [
+        api_server.SelectionCandidate(
+            NetworkServerType.MERCHANT_API,
+            None,
+            api_server.NewServer("A", NetworkServerType.MERCHANT_API)),
+        api_server.SelectionCandidate(
+            NetworkServerType.ELECTRUMX,
+            None,
+            api_server.NewServer("B", NetworkServerType.ELECTRUMX)),
+    ]
+    # Merchant API servers list merkle proof notifications as a capability we do not support yet.
+    # ElectrumX servers do support merkle proofs, and the notification and request capabilities
+    # currently share the same value.
+    selected_candidates = api_server.select_servers(ServerCapability.MERKLE_PROOF_NOTIFICATION,
+        servers)
+    assert [ servers[1] ] == selected_candidates
+
+
 @unittest.mock.patch('electrumsv.network_support.api_server.app_state')
 def test_prioritise_broadcast_servers_invalid_candidate(app_state) -> None:
     fake_tx_size = TransactionSize(100, 20)
@@ -158,3 +210,91 @@ def test_prioritise_broadcast_servers_ordered_candidates(app_state) -> None:
     assert results[1].candidate == servers[0]
     assert results[1].initial_fee == 60
 
+
+def test_get_credential_id_fallbacks() -> None:
+    server = api_server.NewServer("A", NetworkServerType.MERCHANT_API)
+    credential_id = cast(IndefiniteCredentialId, uuid.uuid4())
+    server.client_api_keys[api_server.NewServerAPIContext("wallet_a", 1)] = credential_id
+    server.client_api_keys[api_server.NewServerAPIContext("wallet_b", -1)] = None
+
+    # Direct account match.
+    assert server.get_credential_id(api_server.NewServerAPIContext("wallet_a", 1)) == \
+        (True, credential_id)
+    # A wallet-level entry without a credential is still usable.
+    assert server.get_credential_id(api_server.NewServerAPIContext("wallet_b", 5)) == \
+        (True, None)
+    # No entry for the account or it's wallet, and no application config.
+    assert server.get_credential_id(api_server.NewServerAPIContext("wallet_a", 2)) == \
+        (False, None)
+
+
+def test_unregister_wallet_only_affects_given_wallet() -> None:
+    server = api_server.NewServer("A", NetworkServerType.ELECTRUMX)
+    for wallet_path, account_id in (("wallet_a", 3), ("wallet_a", 1), ("wallet_a", 2),
+            ("wallet_b", 1)):
+        server.set_wallet_usage(wallet_path, NetworkServerState(
+            ServerAccountKey("A", NetworkServerType.ELECTRUMX, account_id), None))
+    server.remove_wallet_usage("wallet_a", ServerAccountKey("A", NetworkServerType.ELECTRUMX, 2))
+
+    # The remaining accounts are unregistered in the order they were registered.
+    results = server.unregister_wallet("wallet_a")
+    assert [ state.key.account_id for state in results ] == [ 3, 1 ]
+    assert list(server.client_api_keys) == [ api_server.NewServerAPIContext("wallet_b", 1) ]
+    assert server.unregister_wallet("wallet_a") == []
+
+
+def test_get_fee_estimator_follows_fee_quote() -> None:
+    key_state = api_server.NewServerAccessState()
+    with pytest.raises(AssertionError):
+        key_state.get_fee_estimator()
+
+    key_state.last_fee_quote = FEE_QUOTE_1
+    estimator1 = key_state.get_fee_estimator()
+    assert estimator1.standard_fee_satoshis == 500
+    assert key_state.get_fee_estimator() is estimator1
+
+    key_state.last_fee_quote = FEE_QUOTE_2
+    estimator2 = key_state.get_fee_estimator()
+    assert estimator2 is not estimator1
+    assert estimator2.standard_fee_satoshis == 100
+
+
+def test_unregister_wallet_preserves_fee_quote_json() -> None:
+    fee_quote_json = json.dumps({ "payload": json.dumps(FAKE_FEE_QUOTE_1), "signature": None,
+        "publicKey": None, "encoding": "UTF-8", "mimetype": "application/json" })
+    server = api_server.NewServer("A", NetworkServerType.MERCHANT_API)
+    server.set_wallet_usage("wallet_a", NetworkServerState(
+        ServerAccountKey("A", NetworkServerType.MERCHANT_API, 1), None, fee_quote_json, 10, 10))
+    assert server.api_key_state[None].last_fee_quote == FAKE_FEE_QUOTE_1
+
+    results = server.unregister_wallet("wallet_a")
+    assert len(results) == 1
+    # The serialised form the wallet provided is passed back as-is.
+    assert results[0].mapi_fee_quote_json is fee_quote_json
+    assert results[0].date_last_good == 10
+
+
+def test_get_fee_quote_response_json_serialises_new_responses() -> None:
+    fee_response = cast(mapi.JSONEnvelope, { "payload": json.dumps(FAKE_FEE_QUOTE_2) })
+    key_state = api_server.NewServerAccessState()
+    assert key_state.get_fee_quote_response_json() is None
+    key_state.set_fee_quote(fee_response, 10)
+    assert json.loads(cast(str, key_state.get_fee_quote_response_json())) == fee_response
+    key_state.set_fee_quote(None, 20)
+    assert key_state.get_fee_quote_response_json() is None
+
+
+def test_should_request_fee_quote_staleness() -> None:
+    server = api_server.NewServer("A", NetworkServerType.MERCHANT_API)
+    key_state = server.api_key_state[None] = api_server.NewServerAccessState()
+    assert server.should_request_fee_quote(None)
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    fee_quote = dict(FAKE_FEE_QUOTE_1, timestamp=now.isoformat())
+    key_state.last_fee_quote = cast(mapi.FeeQuote, fee_quote)
+    assert not server.should_request_fee_quote(None)
+
+    stale_date = now - datetime.timedelta(seconds=api_server.STALE_PERIOD_SECONDS + 60)
+    fee_quote = dict(FAKE_FEE_QUOTE_1, timestamp=stale_date.isoformat())
+    key_state.last_fee_quote = cast(mapi.FeeQuote, fee_quote)
+    assert server.should_request_fee_quote(None)
@@ -1,8 +1,9 @@
+import copy
 import json
 from typing import cast
 
 from bitcoinx import bip32_key_from_string, BIP32PublicKey, P2PKH_Address, PrivateKey, \
-    PublicKey, Tx
+    PublicKey, SigHash, Tx
 import pytest
 
 from electrumsv.bitcoin import address_from_string
@@ -41,6 +42,16 @@ class TestTransaction:
 
         assert json.dumps(tx.to_dict(TransactionContext())) == '{"version": 1, "hex": "010000000149f35e43fefd22d8bb9e4b3ff294c6286154c25712baf6ab77b646e5074d6aed010000002401ff2103b5bbebceeb33c1b61f649596b9c3611c6b2853a1f6b48bce05dd54f667fa2166feffffff0118e43201000000001976a914e158fb15c888037fdc40fb9133b4c1c3c688706488ac5fbd0700", "complete": false, "inputs": [{"script_type": 2, "threshold": 1, "value": 20112600, "signatures": ["ff"], "x_pubkeys": [{"bip32_xpub": "xpub661MyMwAqRbcFL6WFqND2XM2w1EfpBwFfhsSUcw9xDR3nH8eYLv4z4HAhxv5zkqjHojWsPYK1ZSK7yCr8fZ9iWU6D361G2ryv5UgsKjbeDq", "derivation_path": [0, 35]}]}]}'
 
+    def test_tx_unsigned_deepcopy(self):
+        # The transaction dialog copies every transaction it displays.
+        tx = Transaction.from_extended_bytes(bytes.fromhex(unsigned_blob))
+        tx_copy = copy.deepcopy(tx)
+        assert tx_copy == tx
+        assert tx_copy.inputs[0].x_pubkeys[0] is not tx.inputs[0].x_pubkeys[0]
+        assert tx_copy.inputs[0].x_pubkeys[0].to_public_key() == \
+            tx.inputs[0].x_pubkeys[0].to_public_key()
+        assert tx_copy.to_dict(TransactionContext()) == tx.to_dict(TransactionContext())
+
     def test_tx_signed(self):
         # This is testing the extended parsing for a signed transaction.
         tx_bytes = bytes.fromhex(signed_blob)
@@ -77,6 +88,18 @@ class TestTransaction:
         tx = Transaction.from_hex(v2_blob)
         assert tx.txid() == "b97f9180173ab141b61b9f944d841e60feec691d6daab4d4d932b24dd36606fe"
 
+    def test_serialisation_follows_mutation(self):
+        tx = Transaction.from_hex(v2_blob)
+        txid = tx.txid()
+        tx.locktime = 12345
+        assert tx.txid() != txid
+        assert tx.to_hex() != v2_blob
+
+        tx = Transaction.from_io([], Transaction.from_hex(v2_blob).outputs)
+        raw = tx.to_bytes()
+        tx.inputs.extend(Transaction.from_hex(v2_blob).inputs)
+        assert tx.to_bytes() != raw
+
     def test_txid_coinbase_to_p2pk(self):
         tx = Transaction.from_hex('01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff4103400d0302ef02062f503253482f522cfabe6d6dd90d39663d10f8fd25ec88338295d4c6ce1c90d4aeb368d8bdbadcc1da3b635801000000000000000474073e03ffffffff013c25cf2d01000000434104b0bd634234abbb1ba1e986e884185c61cf43e001f9137f23c2c409273eb16e6537a576782eba668a7ef8bd3b3cfb1edb7117ab65129b8a2e681f3c1e0908ef7bac00000000')
         assert 'dbaf14e1c476e76ea05a8b71921a46d6b06f0a950f17c5f9f1a03b8fae467f10' == tx.txid()
@@ -162,6 +185,15 @@ class TestTransaction2:
         assert tx.is_complete()
         assert tx.txid() == "b83acf939a92c420d0cb8d45d5d4dfad4e90369ebce0f49a45808dc1b41259b0"
 
+    def test_update_script_offsets(self):
+        tx = self.sign_tx(unsigned_tx, priv_keys)
+        tx.update_script_offsets()
+        parsed_tx = Transaction.from_hex(signed_tx_3)
+        assert [ (txin.script_offset, txin.script_length) for txin in tx.inputs ] == \
+            [ (txin.script_offset, txin.script_length) for txin in parsed_tx.inputs ]
+        assert [ (txout.script_offset, txout.script_length) for txout in tx.outputs ] == \
+            [ (txout.script_offset, txout.script_length) for txout in parsed_tx.outputs ]
+
     def test_update_signatures(self):
         signed_tx = Tx.from_hex(signed_tx_3)
         sigs = [next(input.script_sig.ops())[:-1] for input in signed_tx.inputs]
@@ -170,6 +202,40 @@ class TestTransaction2:
         assert tx.is_complete()
         assert tx.txid() == "b83acf939a92c420d0cb8d45d5d4dfad4e90369ebce0f49a45808dc1b41259b0"
 
+    def test_preimage_hash_midstates(self):
+        tx = Transaction.from_extended_bytes(bytes.fromhex(unsigned_tx))
+        midstates = tx._compute_bip143_midstates()
+        for input_index, txin in enumerate(tx.inputs):
+            assert tx.preimage_hash(input_index, txin, midstates) == \
+                tx.preimage_hash(input_index, txin)
+
+    # The unsigned transaction has two inputs and one output, so the second input covers the
+    # `SIGHASH_SINGLE` case where there is no matching output.
+    @pytest.mark.parametrize("sighash_base", (SigHash.ALL, SigHash.NONE, SigHash.SINGLE))
+    @pytest.mark.parametrize("anyone_can_pay", (False, True))
+    @pytest.mark.parametrize("forkid", (False, True))
+    def test_signature_hash_with_midstates(self, sighash_base: int, anyone_can_pay: bool,
+            forkid: bool) -> None:
+        sighash = SigHash(sighash_base | (SigHash.ANYONE_CAN_PAY if anyone_can_pay else 0) |
+            (SigHash.FORKID if forkid else 0))
+        tx = Transaction.from_extended_bytes(bytes.fromhex(unsigned_tx))
+        midstates = tx._compute_bip143_midstates()
+        for input_index, txin in enumerate(tx.inputs):
+            script_code = tx.get_preimage_script_bytes(txin)
+            assert tx._signature_hash_with_midstates(input_index, txin.value, script_code,
+                sighash, midstates) == \
+                    Tx.signature_hash(tx, input_index, txin.value, script_code, sighash)
+
+    def test_signature_hash_with_midstates_validation(self) -> None:
+        tx = Transaction.from_extended_bytes(bytes.fromhex(unsigned_tx))
+        midstates = tx._compute_bip143_midstates()
+        script_code = tx.get_preimage_script_bytes(tx.inputs[0])
+        sighash = SigHash(SigHash.ALL | SigHash.FORKID)
+        with pytest.raises(IndexError):
+            tx._signature_hash_with_midstates(len(tx.inputs), 1, script_code, sighash, midstates)
+        with pytest.raises(ValueError):
+            tx._signature_hash_with_midstates(0, -1, script_code, sighash, midstates)
+
     def multisig_keystores(self):
         seed = 'ee6ea9eceaf649640051a4c305ac5c59'
         keystore1 = cast(Old_KeyStore, instantiate_keystore_from_text(
@@ -318,6 +384,8 @@ class TestXPublicKey:
         assert x_pubkey.is_bip32_key()
         assert x_pubkey.bip32_extended_key_and_path() == (xpub, path)
         assert x_pubkey.to_public_key() == True_10_public_key
+        # The derived public key is only calculated once.
+        assert x_pubkey.to_public_key() is x_pubkey.to_public_key()
         assert x_pubkey.to_address() == True_10_public_key.to_address(coin=coin)
         assert x_pubkey.to_address().coin() is coin
 
@@ -24,10 +24,12 @@
 
 import dataclasses
 import enum
+import json
+import logging
+from functools import lru_cache
 from io import BytesIO
-import struct
-from struct import error as struct_error
-from typing import Any, Callable, cast, Dict, Generator, List, Optional, Sequence, Tuple, \
+from struct import error as struct_error, Struct
+from typing import Any, Callable, cast, Dict, List, Optional, Sequence, Tuple, \
     TypedDict, TypeVar, Union
 
 import attr
@@ -36,7 +38,7 @@ from bitcoinx import (
     der_signature_to_compact, double_sha256, hash160, hash_to_hex_str, InvalidSignature,
     Ops, P2PK_Output, P2SH_Address, pack_byte, pack_le_int32, pack_le_uint32, pack_list,
     PrivateKey, PublicKey, push_int, push_item, read_le_int32, read_le_int64, read_le_uint32,
-    read_varint, Script, SigHash, Tx, TxInput, TxOutput, unpack_le_uint16, varint_len
+    read_varint, Script, SigHash, Tx, TxInput, TxOutput, varint_len
 )
 from typing_extensions import Protocol
 
@@ -143,6 +145,28 @@ class SerialisedXPublicKeyDict(TypedDict, total=False):
 
 
 
+# The legacy extended public key serialisation ends with two little-endian 16 bit indexes.
+_unpack_derivation_path_from = Struct('<HH').unpack_from
+
+
+@lru_cache(maxsize=4096)
+def _derive_bip32_public_key(bip32_xpub: str, derivation_path: DerivationPath) \
+        -> BIP32PublicKey:
+    # Deriving each child key is comparatively expensive elliptic curve work, and the same keys
+    # are derived again and again when sizing and signing transactions.
+    result = cast(BIP32PublicKey, bip32_key_from_string(bip32_xpub))
+    for n in derivation_path:
+        result = result.child(n)
+    return result
+
+
+@lru_cache(maxsize=32)
+def _old_mpk_public_key(old_mpk: bytes) -> PublicKey:
+    # Each old style key is derived from the master public key, which does not need to be
+    # parsed and validated again for every key.
+    return PublicKey.from_bytes(pack_byte(4) + old_mpk)
+
+
 class XPublicKeyKind(enum.IntEnum):
     UNKNOWN = 0
     OLD = 1
@@ -162,17 +186,26 @@ class XPublicKey:
     derivation path, which is not directly coupled to the database unlike the id fields.
     """
 
-    _old_mpk: Optional[bytes] = None
-    _bip32_xpub: Optional[str] = None
-    _pubkey_bytes: Optional[bytes] = None
-    # Logic should know when this field has populated id fields and when it does not. This is
-    # addressed in the class docstring above. If the public key is a master public key, then this
-    # field will have a value and only `derivation_path` will be provided externally.
-    _derivation_data: Optional[DatabaseKeyDerivationData] = None
+    # Incomplete transactions can have a large number of these, so avoid per-instance dicts.
+    __slots__ = ("_old_mpk", "_bip32_xpub", "_pubkey_bytes", "_derivation_data", "_public_key",
+        "_hash")
 
     def __init__(self, pubkey_bytes: Optional[bytes]=None, bip32_xpub: Optional[str]=None,
             old_mpk: Optional[bytes]=None,
             derivation_data: Optional[DatabaseKeyDerivationData]=None) -> None:
+        self._old_mpk: Optional[bytes] = None
+        self._bip32_xpub: Optional[str] = None
+        self._pubkey_bytes: Optional[bytes] = None
+        # Logic should know when this field has populated id fields and when it does not. This
+        # is addressed in the class docstring above. If the public key is a master public key,
+        # then this field will have a value and only `derivation_path` will be provided
+        # externally.
+        self._derivation_data: Optional[DatabaseKeyDerivationData] = None
+        # The key data is not modified after construction so the public key is only calculated
+        # once.
+        self._public_key: Optional[Union[BIP32PublicKey, PublicKey]] = None
+        self._hash: Optional[int] = None
+
         if pubkey_bytes is not None:
             assert isinstance(pubkey_bytes, bytes)
             self._pubkey_bytes = pubkey_bytes
@@ -191,6 +224,16 @@ class XPublicKey:
         # Verify that the public key data is valid.
         self.to_public_key()
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # The cached public key wraps library objects that cannot be copied or pickled, and it
+        # can be calculated again from the other fields.
+        return { name: getattr(self, name) for name in self.__slots__ if name != "_public_key" }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._public_key = None
+
     @classmethod
     def from_dict(cls, data: SerialisedXPublicKeyDict) -> 'XPublicKey':
         bip32_xpub: Optional[str] = data.get("bip32_xpub")
@@ -226,13 +269,13 @@ class XPublicKey:
             assert len(raw) == 83, f"got {len(raw)}"
             bip32_xpub = base58_encode_check(raw[1:79])
             derivation_data = DatabaseKeyDerivationData(
-                derivation_path=tuple(unpack_le_uint16(raw[n: n+2])[0] for n in (79, 81)),
+                derivation_path=_unpack_derivation_path_from(raw, 79),
                 source=DatabaseKeyDerivationType.IMPORTED)
         elif kind == 0xfe:
             assert len(raw) == 69
             old_mpk = raw[1:65]  # The public key bytes without the 0x04 prefix
             derivation_data = DatabaseKeyDerivationData(
-                derivation_path=tuple(unpack_le_uint16(raw[n: n+2])[0] for n in (65, 67)),
+                derivation_path=_unpack_derivation_path_from(raw, 65),
                 source=DatabaseKeyDerivationType.IMPORTED)
         else:
             # NOTE(rt12) We do not appear to handle this? Was this ever a thing?
@@ -267,7 +310,14 @@ class XPublicKey:
         return cast(bytes, self.to_public_key().to_bytes(compressed=compressed))
 
     def __eq__(self, other: object) -> bool:
-        return (isinstance(other, XPublicKey) and self._pubkey_bytes == other._pubkey_bytes and
+        if self is other:
+            return True
+        if not isinstance(other, XPublicKey):
+            return False
+        # Keys used for dictionary lookups will have their hashes cached already.
+        if self._hash is not None and other._hash is not None and self._hash != other._hash:
+            return False
+        return (self._pubkey_bytes == other._pubkey_bytes and
             self._old_mpk == other._old_mpk and self._bip32_xpub == other._bip32_xpub and
             ((self._derivation_data is None and other._derivation_data is None) or
                 (self._derivation_data is not None and other._derivation_data is not None and \
@@ -276,8 +326,10 @@ class XPublicKey:
 
     def __hash__(self) -> int:
         # This just needs to be unique for dictionary indexing.
-        return hash((self._pubkey_bytes, self._old_mpk, self._bip32_xpub,
-            None if self._derivation_data is None else self._derivation_data.derivation_path))
+        if self._hash is None:
+            self._hash = hash((self._pubkey_bytes, self._old_mpk, self._bip32_xpub,
+                None if self._derivation_data is None else self._derivation_data.derivation_path))
+        return self._hash
 
     def kind(self) -> XPublicKeyKind:
         if self._bip32_xpub is not None:
@@ -329,20 +381,23 @@ class XPublicKey:
 
     def to_public_key(self) -> Union[BIP32PublicKey, PublicKey]:
         '''Returns either a bitcoinx BIP32PublicKey or PublicKey instance.'''
+        if self._public_key is None:
+            self._public_key = self._calculate_public_key()
+        return self._public_key
+
+    def _calculate_public_key(self) -> Union[BIP32PublicKey, PublicKey]:
         if self._pubkey_bytes is not None:
             return PublicKey.from_bytes(self._pubkey_bytes)
         elif self._bip32_xpub is not None:
             assert self._derivation_data is not None
             assert self._derivation_data.derivation_path is not None
-            result = cast(BIP32PublicKey, bip32_key_from_string(self._bip32_xpub))
-            for n in self._derivation_data.derivation_path:
-                result = result.child(n)
-            return result
+            return _derive_bip32_public_key(self._bip32_xpub,
+                tuple(self._derivation_data.derivation_path))
         elif self._old_mpk is not None:
             assert self._derivation_data is not None
             assert self._derivation_data.derivation_path is not None
             path = self._derivation_data.derivation_path
-            pubkey = PublicKey.from_bytes(pack_byte(4) + self._old_mpk)
+            pubkey = _old_mpk_public_key(self._old_mpk)
             # pylint: disable=unsubscriptable-object
             delta = double_sha256(f'{path[1]}:{path[0]}:'.encode() + self._old_mpk)
             return pubkey.add(delta)
@@ -387,30 +442,37 @@ class XTxInput(TxInput): # type: ignore[misc]
     script_offset: int = attr.ib(default=0)
     script_length: int = attr.ib(default=0)
 
-    @classmethod
-    def read(cls, read: ReadBytesFunc, tell: TellFunc) -> 'XTxInput':
-        # This section is duplicated in `XTxInput.read_extended`
+    @staticmethod
+    def _read_fields(read: ReadBytesFunc, tell: TellFunc) -> Tuple[bytes, int, bytes, int, int]:
+        """
+        Read the fields common to both the standard and extended serialisation formats.
+
+        Returns the previous hash, previous index, script sig bytes, script sig offset and the
+        sequence.
+        """
         prev_hash = read(32)
         prev_idx = read_le_uint32(read)
         script_sig_bytes, script_sig_offset = xread_varbytes(read, tell)
-        script_sig = Script(script_sig_bytes)
         sequence = read_le_uint32(read)
 
         assert script_sig_offset != 0
         assert len(script_sig_bytes) != 0
+        return prev_hash, prev_idx, script_sig_bytes, script_sig_offset, sequence
 
+    @classmethod
+    def read(cls, read: ReadBytesFunc, tell: TellFunc) -> 'XTxInput':
+        prev_hash, prev_idx, script_sig_bytes, script_sig_offset, sequence = \
+            cls._read_fields(read, tell)
+        script_sig = Script(script_sig_bytes)
         # NOTE(rt12) workaround for mypy not recognising the base class init arguments.
         return cls(prev_hash, prev_idx, script_sig, sequence, # type: ignore[arg-type]
             script_offset=script_sig_offset, script_length=len(script_sig_bytes))
 
     @classmethod
     def read_extended(cls, read: ReadBytesFunc, tell: TellFunc) -> 'XTxInput':
-        # This section is duplicated in `XTxInput.read`
-        prev_hash = read(32)
-        prev_idx = read_le_uint32(read)
-        script_sig_bytes, script_sig_offset = xread_varbytes(read, tell)
+        prev_hash, prev_idx, script_sig_bytes, script_sig_offset, sequence = \
+            cls._read_fields(read, tell)
         script_sig = Script(script_sig_bytes)
-        sequence = read_le_uint32(read)
 
         kwargs = {
             'x_pubkeys': [],
@@ -419,9 +481,6 @@ class XTxInput(TxInput): # type: ignore[misc]
             'script_offset': script_sig_offset,
             'script_length': len(script_sig_bytes),
         }
-        assert script_sig_offset != 0
-        assert len(script_sig_bytes) != 0
-
         if prev_hash != bytes(32):
             parse_script_sig(script_sig_bytes, kwargs)
             # NOTE(rt12) Why do we delete this?
@@ -462,15 +521,17 @@ class XTxInput(TxInput): # type: ignore[misc]
 
     def estimated_size(self) -> TransactionSize:
         '''Return an estimated of serialized input size in bytes.'''
-        saved_script_sig = self.script_sig
-        # TODO(MAPI) Should this be the raw x_pubkeys not the public keys? It does not matter
-        #   as the `create_script_sig` method only calls `to_bytes`.
-        x_pubkeys = [x_pubkey.to_public_key() for x_pubkey in self.x_pubkeys]
-        signatures = [dummy_signature] * self.threshold
-        self.script_sig = create_script_sig(self.script_type, self.threshold, x_pubkeys, signatures)
-        size = self.size()
-        self.script_sig = saved_script_sig
-        return TransactionSize(size, 0)
+        # This is the size of the script sig with `dummy_signature` for each required signature.
+        public_key_sizes = [ 33 if x_pubkey.is_compressed() else 65
+            for x_pubkey in self.x_pubkeys ]
+        script_sig_size = estimated_script_sig_size(self.script_type, self.threshold,
+            public_key_sizes)
+        # 32               <previous hash>
+        # 4                <previous index>
+        # 1-9              <script size>
+        # <script size>    <script bytes>
+        # 4                <sequence>
+        return TransactionSize(32 + 4 + varint_len(script_sig_size) + script_sig_size + 4, 0)
 
     def size(self) -> int:
         return len(TxInput.to_bytes(self))
@@ -525,13 +586,12 @@ class XTxOutput(TxOutput): # type: ignore[misc]
         # 1-9             <script size>
         # <script size>   <script bytes>
         script_bytes = self.script_pubkey.to_bytes()
-        standard_size = 8 + varint_len(len(script_bytes))
-        data_size = 0
-        if script_bytes.startswith(DATA_PREFIX1) or script_bytes.startswith(DATA_PREFIX2):
-            data_size += len(script_bytes)
-        else:
-            standard_size += len(script_bytes)
-        return TransactionSize(standard_size, data_size)
+        script_size = len(script_bytes)
+        # Almost all output scripts are small enough for a single byte size.
+        standard_size = 8 + (1 if script_size < 0xfd else varint_len(script_size))
+        if script_bytes.startswith(DATA_PREFIXES):
+            return TransactionSize(standard_size, script_size)
+        return TransactionSize(standard_size + script_size, 0)
 
     def __repr__(self) -> str:
         return (
@@ -541,7 +601,20 @@ class XTxOutput(TxOutput): # type: ignore[misc]
         )
 
 
-def _script_GetOp(_bytes: bytes) -> Generator[Tuple[int, Optional[bytes], int], None, None]:
+# Plain integer copies of the opcodes used when parsing scripts, as looking up enum members is
+# comparatively slow and parsing visits every opcode in every script.
+_OP_PUSHDATA1 = int(Ops.OP_PUSHDATA1)
+_OP_PUSHDATA2 = int(Ops.OP_PUSHDATA2)
+_OP_PUSHDATA4 = int(Ops.OP_PUSHDATA4)
+# Precompiled so that the format string is not parsed again for every push data length.
+_unpack_le_uint16_from = Struct('<H').unpack_from
+_unpack_le_uint32_from = Struct('<I').unpack_from
+_unpack_le_uint64_from = Struct('<Q').unpack_from
+
+
+def _script_GetOp(_bytes: bytes) -> List[Tuple[int, Optional[bytes], int]]:
+    decoded: List[Tuple[int, Optional[bytes], int]] = []
+    append = decoded.append
     i = 0
     blen = len(_bytes)
     while i < blen:
@@ -549,35 +622,51 @@ def _script_GetOp(_bytes: bytes) -> Generator[Tuple[int, Optional[bytes], int],
         opcode = _bytes[i]
         i += 1
 
-        if opcode <= Ops.OP_PUSHDATA4:
-            nSize = opcode
-            if opcode == Ops.OP_PUSHDATA1:
+        if opcode <= _OP_PUSHDATA4:
+            # Signatures and public keys are direct pushes, so test for those first.
+            if opcode < _OP_PUSHDATA1:
+                nSize = opcode
+            elif opcode == _OP_PUSHDATA1:
                 nSize = _bytes[i] if i < blen else 0
                 i += 1
-            elif opcode == Ops.OP_PUSHDATA2:
+            elif opcode == _OP_PUSHDATA2:
                 # tolerate truncated script
-                (nSize,) = struct.unpack_from('<H', _bytes, i) if i+2 <= blen else (0,)
+                (nSize,) = _unpack_le_uint16_from(_bytes, i) if i+2 <= blen else (0,)
                 i += 2
-            elif opcode == Ops.OP_PUSHDATA4:
-                (nSize,) = struct.unpack_from('<I', _bytes, i) if i+4 <= blen else (0,)
+            else:
+                (nSize,) = _unpack_le_uint32_from(_bytes, i) if i+4 <= blen else (0,)
                 i += 4
             # array slicing here never throws exception even if truncated script
             vch = _bytes[i:i + nSize]
             i += nSize
 
-        yield opcode, vch, i
+        append((opcode, vch, i))
+    return decoded
+
+
+def _read_varint_from(raw: bytes, offset: int) -> Tuple[int, int]:
+    """
+    Read the varint at the given offset, returning its value and the offset of the byte after it.
+    """
+    size = raw[offset]
+    if size < 0xfd:
+        return size, offset + 1
+    if size == 0xfd:
+        return _unpack_le_uint16_from(raw, offset + 1)[0], offset + 3
+    if size == 0xfe:
+        return _unpack_le_uint32_from(raw, offset + 1)[0], offset + 5
+    return _unpack_le_uint64_from(raw, offset + 1)[0], offset + 9
 
 
 def _match_decoded(decoded: List[Tuple[int, Optional[bytes], int]],
         to_match: List[Union[int, Ops]]) -> bool:
     if len(decoded) != len(to_match):
         return False
-    for i in range(len(decoded)):
+    for (opcode, _vch, _offset), match_opcode in zip(decoded, to_match):
         # Ops below OP_PUSHDATA4 all just push data
-        if (to_match[i] == Ops.OP_PUSHDATA4 and
-                decoded[i][0] <= Ops.OP_PUSHDATA4 and decoded[i][0] > 0):
+        if match_opcode == _OP_PUSHDATA4 and 0 < opcode <= _OP_PUSHDATA4:
             continue
-        if to_match[i] != decoded[i][0]:
+        if match_opcode != opcode:
             return False
     return True
 
@@ -612,12 +701,21 @@ def bare_multisignatures(threshold: int, signatures: List[bytes]) -> List[bytes]
     padded out with NO_SIGNATURE entries to keep the script in correct structure, this only
     happens for incomplete transactions.
     '''
-    present_signatures = [ value for value in signatures if value != NO_SIGNATURE ][:threshold]
-    while len(present_signatures) < threshold:
-        present_signatures.append(NO_SIGNATURE)
+    present_signatures: List[bytes] = []
+    for signature in signatures:
+        if len(present_signatures) == threshold:
+            break
+        if signature != NO_SIGNATURE:
+            present_signatures.append(signature)
+    present_signatures.extend([ NO_SIGNATURE ] * (threshold - len(present_signatures)))
     return present_signatures
 
 
+_OP_0_BYTES = pack_byte(Ops.OP_0)
+_OP_FALSE_BYTES = pack_byte(Ops.OP_FALSE)
+_OP_TRUE_BYTES = pack_byte(Ops.OP_TRUE)
+
+
 def create_script_sig(script_type: ScriptType, threshold: int,
         pubkeylikes: Sequence[SupportsToBytes], signatures: List[bytes]) -> Script:
     if script_type == ScriptType.P2PK:
@@ -626,35 +724,75 @@ def create_script_sig(script_type: ScriptType, threshold: int,
         return Script(push_item(signatures[0]) + push_item(pubkeylikes[0].to_bytes()))
     elif script_type == ScriptType.MULTISIG_P2SH:
         prepared_signatures = bare_multisignatures(threshold, signatures)
-        parts = [pack_byte(Ops.OP_0)]
-        parts.extend(push_item(signature) for signature in prepared_signatures)
+        parts = [_OP_0_BYTES]
+        parts.extend(map(push_item, prepared_signatures))
         nested_script = multisig_script(pubkeylikes, threshold)
         parts.append(push_item(nested_script))
         return Script(b''.join(parts))
     elif script_type == ScriptType.MULTISIG_BARE:
         prepared_signatures = bare_multisignatures(threshold, signatures)
-        parts = [pack_byte(Ops.OP_0)]
-        parts.extend(push_item(signature) for signature in prepared_signatures)
+        parts = [_OP_0_BYTES]
+        parts.extend(map(push_item, prepared_signatures))
         return Script(b''.join(parts))
     elif script_type == ScriptType.MULTISIG_ACCUMULATOR:
+        # Each signature is serialised as one piece, and the pieces are joined in reverse order.
         parts = []
         for i, signature in enumerate(signatures):
             if signature == NO_SIGNATURE:
-                parts.append([ pack_byte(Ops.OP_FALSE) ])
+                parts.append(_OP_FALSE_BYTES)
             else:
-                parts.append([
-                    push_item(signature),
-                    push_item(pubkeylikes[i].to_bytes()),
-                    pack_byte(Ops.OP_TRUE),
-                ])
-        parts.reverse()
-        return Script(b''.join([ value for l in parts for value in l ]))
+                parts.append(push_item(signature) + push_item(pubkeylikes[i].to_bytes()) +
+                    _OP_TRUE_BYTES)
+        return Script(b''.join(reversed(parts)))
+    raise ValueError(f"unable to realize script {script_type}")
+
+
+def _push_item_size(item_size: int) -> int:
+    # The size of `push_item` for data that is never pushed as a single opcode (over one byte).
+    if item_size < _OP_PUSHDATA1:
+        return 1 + item_size
+    if item_size <= 0xff:
+        return 2 + item_size
+    if item_size <= 0xffff:
+        return 3 + item_size
+    return 5 + item_size
+
+
+# Size estimation uses the same dummy signature for every signature in every input.
+_DUMMY_SIGNATURE_PUSH_SIZE = _push_item_size(len(dummy_signature))
+
+
+def estimated_script_sig_size(script_type: ScriptType, threshold: int,
+        public_key_sizes: Sequence[int]) -> int:
+    """
+    Calculate the size of the script sig `create_script_sig` would create for the given public
+    keys, where each of the `threshold` signatures is `dummy_signature`.
+
+    This avoids creating the script, and as the public key sizes are provided, any public key
+    derivation.
+    """
+    signature_push_size = _DUMMY_SIGNATURE_PUSH_SIZE
+    if script_type == ScriptType.P2PK:
+        return signature_push_size
+    elif script_type == ScriptType.P2PKH:
+        return signature_push_size + _push_item_size(public_key_sizes[0])
+    elif script_type == ScriptType.MULTISIG_P2SH:
+        assert 1 <= threshold <= len(public_key_sizes)
+        nested_script_size = len(push_int(threshold)) + \
+            sum(_push_item_size(size) for size in public_key_sizes) + \
+            len(push_int(len(public_key_sizes))) + 1
+        return 1 + threshold * signature_push_size + _push_item_size(nested_script_size)
+    elif script_type == ScriptType.MULTISIG_BARE:
+        return 1 + threshold * signature_push_size
+    elif script_type == ScriptType.MULTISIG_ACCUMULATOR:
+        return sum(signature_push_size + _push_item_size(size) + 1
+            for size in public_key_sizes[:threshold])
     raise ValueError(f"unable to realize script {script_type}")
 
 
 def parse_script_sig(script: bytes, kwargs: Dict[str, Any]) -> None:
     try:
-        decoded = list(_script_GetOp(script))
+        decoded = _script_GetOp(script)
     except Exception:
         # coinbase transactions raise an exception
         logger.exception("cannot find address in input script %s", script.hex())
@@ -693,7 +831,7 @@ def parse_script_sig(script: bytes, kwargs: Dict[str, Any]) -> None:
 
     nested_script = decoded[-1][1]
     assert nested_script is not None
-    nested_decoded = [ x for x in _script_GetOp(nested_script) ]
+    nested_decoded = _script_GetOp(nested_script)
     nested_decoded_inner = cast(List[Tuple[int, bytes, int]], nested_decoded[1:-2])
     x_pubkeys = [XPublicKey.from_bytes(x[1]) for x in nested_decoded_inner]
     m, n, match_multisig = _extract_multisig_pattern(nested_decoded)
@@ -714,7 +852,6 @@ def tx_dict_from_text(text: str) -> Dict[str, Any]:
 
     Raises `ValueError` if the text is not valid.
     """
-    import json
     text = text.strip()
     if not text:
         raise ValueError("empty string")
@@ -734,12 +871,44 @@ def tx_dict_from_text(text: str) -> Dict[str, Any]:
 
 DATA_PREFIX1 = bytes.fromhex("6a")
 DATA_PREFIX2 = bytes.fromhex("006a")
+DATA_PREFIXES = (DATA_PREFIX1, DATA_PREFIX2)
+
+
+def _p2pkh_preimage_script_bytes(txin: XTxInput) -> bytes:
+    return cast(bytes, txin.x_pubkeys[0].to_public_key().P2PKH_script().to_bytes())
+
+
+def _multisig_preimage_script_bytes(txin: XTxInput) -> bytes:
+    return multisig_script(txin.x_pubkeys, txin.threshold)
+
+
+def _accumulator_preimage_script_bytes(txin: XTxInput) -> bytes:
+    return AccumulatorMultiSigOutput(
+        [ v.to_bytes() for v in txin.x_pubkeys ], txin.threshold).to_script_bytes()
+
+
+def _p2pk_preimage_script_bytes(txin: XTxInput) -> bytes:
+    return cast(bytes, txin.x_pubkeys[0].to_public_key().P2PK_script().to_bytes())
+
+
+# The script code signed for each type of input, looked up once per input being signed.
+_PREIMAGE_SCRIPT_BUILDERS: Dict[ScriptType, Callable[[XTxInput], bytes]] = {
+    ScriptType.P2PKH: _p2pkh_preimage_script_bytes,
+    ScriptType.MULTISIG_P2SH: _multisig_preimage_script_bytes,
+    ScriptType.MULTISIG_BARE: _multisig_preimage_script_bytes,
+    ScriptType.MULTISIG_ACCUMULATOR: _accumulator_preimage_script_bytes,
+    ScriptType.P2PK: _p2pk_preimage_script_bytes,
+}
 
 
 # NOTE(typing) Disable the 'Class cannot subclass "Tx" (has type "Any")' message.
 @attr.s(slots=True)
 class Transaction(Tx): # type: ignore[misc]
     SIGHASH_FORKID = 0x40
+    # The hash type used for every signature, which `nHashType` returns, and the byte appended
+    # to each signature for it.
+    _SIGHASH = SigHash(SigHash.ALL | SIGHASH_FORKID)
+    _HASH_TYPE_BYTE = bytes([_SIGHASH])
 
     inputs: List[XTxInput] = attr.ib(default=attr.Factory(list))
     outputs: List[XTxOutput] = attr.ib(default=attr.Factory(list))
@@ -747,6 +916,8 @@ class Transaction(Tx): # type: ignore[misc]
     @classmethod
     def from_io(cls, inputs: List[XTxInput], outputs: List[XTxOutput], locktime: int=0) \
             -> "Transaction":
+        # The outputs are copied because the coin chooser appends change outputs to the new
+        # transaction, and the callers reuse their list of payment outputs for later attempts.
         # NOTE(typing) Until the base class is fully typed it's attrs won't be found properly.
         return cls(version=1, locktime=locktime, # type: ignore[call-arg]
             inputs=inputs, outputs=outputs.copy())
@@ -797,14 +968,40 @@ class Transaction(Tx): # type: ignore[misc]
     def update_script_offsets(self) -> None:
         """Amend inputs and outputs in-situ to include script_offset and script_length data"""
         assert self.is_complete(), "script_offset can only be calculated from a signed transaction"
-        tx_with_offsets = Transaction.from_bytes(self.to_bytes())
-        for index, input in enumerate(tx_with_offsets.inputs):
-            self.inputs[index].script_offset = input.script_offset
-            self.inputs[index].script_length = input.script_length
+        input_spans, output_spans = self._compute_script_spans()
+        for input, (script_offset, script_length) in zip(self.inputs, input_spans):
+            input.script_offset = script_offset
+            input.script_length = script_length
 
-        for index, output in enumerate(tx_with_offsets.outputs):
-            self.outputs[index].script_offset = output.script_offset
-            self.outputs[index].script_length = output.script_length
+        for output, (script_offset, script_length) in zip(self.outputs, output_spans):
+            output.script_offset = script_offset
+            output.script_length = script_length
+
+    def _compute_script_spans(self) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+        """
+        Walk the serialised transaction to locate each input and output script.
+
+        Returns the offset and length of every input script and of every output script.
+        """
+        raw = self.to_bytes()
+        # Skip the version.
+        input_count, offset = _read_varint_from(raw, 4)
+        input_spans: List[Tuple[int, int]] = []
+        for _ in range(input_count):
+            # Skip the outpoint.
+            script_length, offset = _read_varint_from(raw, offset + 36)
+            input_spans.append((offset, script_length))
+            # Skip the script and the sequence.
+            offset += script_length + 4
+
+        output_count, offset = _read_varint_from(raw, offset)
+        output_spans: List[Tuple[int, int]] = []
+        for _ in range(output_count):
+            # Skip the value.
+            script_length, offset = _read_varint_from(raw, offset + 8)
+            output_spans.append((offset, script_length))
+            offset += script_length
+        return input_spans, output_spans
 
     def is_complete(self) -> bool:
         '''Return true if this input has all signatures present.'''
@@ -822,15 +1019,21 @@ class Transaction(Tx): # type: ignore[misc]
         if len(self.inputs) != len(signatures):
             raise RuntimeError('expected {} signatures; got {}'
                                .format(len(self.inputs), len(signatures)))
+        midstates = self._compute_bip143_midstates()
         txin: XTxInput
         signature: bytes
-        for txin, signature in zip(self.inputs, signatures):
-            full_sig = signature + bytes([self.nHashType()])
-            logger.warning(f'Signature: {full_sig.hex()}')
+        for input_index, (txin, signature) in enumerate(zip(self.inputs, signatures)):
+            full_sig = signature + self._HASH_TYPE_BYTE
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Signature: %s', full_sig.hex())
             if full_sig in txin.signatures:
                 continue
-            pubkeys = [x_pubkey.to_public_key() for x_pubkey in txin.x_pubkeys]
-            pre_hash = self.preimage_hash(txin)
+            # Recovered keys are matched by their compressed form, as `PublicKey` equality does.
+            pubkey_indexes: Dict[bytes, int] = {}
+            for j, x_pubkey in enumerate(txin.x_pubkeys):
+                pubkey_indexes.setdefault(
+                    x_pubkey.to_public_key().to_bytes(compressed=True), j)
+            pre_hash = self.preimage_hash(input_index, txin, midstates)
             rec_sig_base = der_signature_to_compact(signature)
             for recid in range(4):
                 rec_sig = rec_sig_base + bytes([recid])
@@ -839,54 +1042,91 @@ class Transaction(Tx): # type: ignore[misc]
                 except (InvalidSignature, ValueError):
                     # the point might not be on the curve for some recid values
                     continue
-                if public_key in pubkeys:
-                    try:
-                        public_key.verify_recoverable_signature(rec_sig, pre_hash, None)
-                    except Exception:
-                        logger.exception('')
-                        continue
-                    j = pubkeys.index(public_key)
-                    logger.debug('adding sig %d %s %r', j, public_key, full_sig)
-                    txin.signatures[j] = full_sig
-                    break
+                pubkey_index = pubkey_indexes.get(public_key.to_bytes(compressed=True))
+                if pubkey_index is None:
+                    continue
+                # A key recovered from the signature and hash is by definition one the signature
+                # is valid for, so there is no need to verify it again.
+                logger.debug('adding sig %d %s %r', pubkey_index, public_key, full_sig)
+                txin.signatures[pubkey_index] = full_sig
+                break
 
     @classmethod
     def get_preimage_script_bytes(cls, txin: XTxInput) -> bytes:
         _type = txin.type()
-        if _type == ScriptType.P2PKH:
-            x_pubkey = txin.x_pubkeys[0]
-            script = x_pubkey.to_public_key().P2PKH_script()
-            return cast(bytes, script.to_bytes())
-        elif _type == ScriptType.MULTISIG_P2SH or _type == ScriptType.MULTISIG_BARE:
-            return multisig_script(txin.x_pubkeys, txin.threshold)
-        elif _type == ScriptType.MULTISIG_ACCUMULATOR:
-            return AccumulatorMultiSigOutput(
-                [ v.to_bytes() for v in txin.x_pubkeys ], txin.threshold).to_script_bytes()
-        elif _type == ScriptType.P2PK:
-            x_pubkey = txin.x_pubkeys[0]
-            script = x_pubkey.to_public_key().P2PK_script()
-            return cast(bytes, script.to_bytes())
-        else:
+        builder = _PREIMAGE_SCRIPT_BUILDERS.get(_type)
+        if builder is None:
             raise RuntimeError('Unknown txin type', _type)
+        return builder(txin)
 
     def BIP_LI01_sort(self) -> None:
         # See https://github.com/kristovatlas/rfc/blob/master/bips/bip-li01.mediawiki
-        self.inputs.sort(key = lambda txin: cast(bytes, txin.prevout_bytes()))
+        self.inputs.sort(key = XTxInput.prevout_bytes)
         self.outputs.sort(key = lambda output: (output.value, output.script_pubkey.to_bytes()))
 
     @classmethod
     def nHashType(cls) -> int:
         '''Hash type in hex.'''
-        return 0x01 | cls.SIGHASH_FORKID
+        return int(cls._SIGHASH)
 
-    def preimage_hash(self, txin: XTxInput) -> bytes:
-        input_index = self.inputs.index(txin)
+    def _compute_bip143_midstates(self) -> Tuple[bytes, bytes, bytes]:
+        """
+        The hashes of the prevouts, sequences and outputs do not depend on the input being
+        signed, so signing passes compute them once and reuse them for each input.
+        """
+        return (
+            double_sha256(b''.join([ txin.prevout_bytes() for txin in self.inputs ])),
+            double_sha256(b''.join([ pack_le_uint32(txin.sequence) for txin in self.inputs ])),
+            double_sha256(b''.join([ txout.to_bytes() for txout in self.outputs ])),
+        )
+
+    def _signature_hash_with_midstates(self, input_index: int, value: int, script_code: bytes,
+            sighash: SigHash, midstates: Tuple[bytes, bytes, bytes]) -> bytes:
+        """
+        Equivalent to the bitcoinx `signature_hash` method, but for the post-fork algorithm it
+        uses the precomputed hashes from `_compute_bip143_midstates` rather than hashing every
+        input and output again.
+        """
+        if not 0 <= input_index < len(self.inputs):
+            raise IndexError(f'invalid input index: {input_index}')
+        if value < 0:
+            raise ValueError(f'value cannot be negative: {value}')
+        if not sighash.has_forkid():
+            return cast(bytes, self.signature_hash(input_index, value, script_code, sighash))
+
+        hash_prevouts = hash_sequence = hash_outputs = bytes(32)
+        sighash_not_single_none = sighash.base not in (SigHash.SINGLE, SigHash.NONE)
+        if not sighash.anyone_can_pay:
+            hash_prevouts = midstates[0]
+            if sighash_not_single_none:
+                hash_sequence = midstates[1]
+        if sighash_not_single_none:
+            hash_outputs = midstates[2]
+        elif sighash.base == SigHash.SINGLE and input_index < len(self.outputs):
+            hash_outputs = double_sha256(self.outputs[input_index].to_bytes())
+
+        return cast(bytes, double_sha256(b''.join((
+            pack_le_int32(self.version),
+            hash_prevouts,
+            hash_sequence,
+            self.inputs[input_index].to_bytes_for_signature(value, script_code),
+            hash_outputs,
+            pack_le_uint32(self.locktime),
+            pack_le_uint32(sighash),
+        ))))
+
+    def preimage_hash(self, input_index: int, txin: XTxInput,
+            midstates: Optional[Tuple[bytes, bytes, bytes]]=None) -> bytes:
         script_code = self.get_preimage_script_bytes(txin)
-        sighash = SigHash(self.nHashType())
+        sighash = self._SIGHASH
         # Original BTC algorithm: https://en.bitcoin.it/wiki/OP_CHECKSIG
         # Current algorithm: https://github.com/electrumsv/bips/blob/master/bip-0143.mediawiki
-        return cast(bytes,
-            self.signature_hash(input_index, txin.value, script_code, sighash=sighash))
+        if midstates is None:
+            return cast(bytes,
+                self.signature_hash(input_index, txin.value, script_code, sighash=sighash))
+        # NOTE(typing) A value of None should raise, as it does in `signature_hash`.
+        return self._signature_hash_with_midstates(input_index, txin.value, # type: ignore[arg-type]
+            script_code, sighash, midstates)
 
     def serialize(self) -> str:
         return self.to_bytes().hex()
@@ -900,10 +1140,11 @@ class Transaction(Tx): # type: ignore[misc]
     def input_value(self) -> int:
         # NOTE(typing) We assume that this is int, not None. It will raise if a value is None,
         # which is desirable if it is incorrectly present.
-        return sum(txin.value for txin in self.inputs) # type: ignore
+        # Summing a list is faster than summing a generator, which resumes a frame per value.
+        return sum([ txin.value for txin in self.inputs ]) # type: ignore
 
     def output_value(self) -> int:
-        return sum(output.value for output in self.outputs)
+        return sum([ output.value for output in self.outputs ])
 
     def get_fee(self) -> int:
         return self.input_value() - self.output_value()
@@ -948,21 +1189,24 @@ class Transaction(Tx): # type: ignore[misc]
 
     def sign(self, keypairs: Dict[XPublicKey, Tuple[bytes, bool]]) -> None:
         assert all(isinstance(key, XPublicKey) for key in keypairs)
-        for txin in self.inputs:
+        midstates = self._compute_bip143_midstates()
+        for input_index, txin in enumerate(self.inputs):
             if txin.is_complete():
                 continue
             for j, x_pubkey in enumerate(txin.x_pubkeys):
                 if x_pubkey in keypairs:
                     logger.debug("adding signature for %s", x_pubkey)
                     sec, compressed = keypairs[x_pubkey]
-                    txin.signatures[j] = self._sign_txin(txin, sec)
+                    txin.signatures[j] = self._sign_txin(input_index, txin, sec,
+                        midstates)
         logger.debug("is_complete %s", self.is_complete())
 
-    def _sign_txin(self, txin: XTxInput, privkey_bytes: bytes) -> bytes:
-        pre_hash = self.preimage_hash(txin)
+    def _sign_txin(self, input_index: int, txin: XTxInput, privkey_bytes: bytes,
+            midstates: Optional[Tuple[bytes, bytes, bytes]]=None) -> bytes:
+        pre_hash = self.preimage_hash(input_index, txin, midstates)
         privkey = PrivateKey(privkey_bytes)
         sig = cast(bytes, privkey.sign(pre_hash, None))
-        return sig + cast(bytes, pack_byte(self.nHashType()))
+        return sig + self._HASH_TYPE_BYTE
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> Tuple['Transaction', TransactionContext]: